@@ -0,0 +1,66 @@
+"""
+One-off backfill for the attributes behind the user-enumeration GSIs.
+
+Plaid items linked before GsiByAllItems existed have no gsi_pk, and reminders
+written before ByRemindersExist existed have no reminders_exist, so neither shows
+up in the index queries the daily sync and reminder jobs rely on. Run this once
+after deploying the indexes; it only touches items missing the attribute, so it
+is safe to re-run.
+
+Usage (with credentials for the deployed account):
+    python backend/scripts/backfill_index_attributes.py
+Table names default to the ones in template.yaml and can be overridden with
+PLAID_ITEMS_TABLE / SUBSCRIPTION_REMINDERS_TABLE.
+"""
+import os
+import sys
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from services.dynamodb_service import PLAID_ITEM_GSI_PK  # noqa: E402
+
+def backfill(table, key_names, attribute: str, value) -> int:
+    """Set attribute = value on every item of table that doesn't have it yet. Returns the number updated."""
+    updated = 0
+    scan_kwargs = {
+        'FilterExpression': Attr(attribute).not_exists(),
+        'ProjectionExpression': ", ".join(f"#{key}" for key in key_names),
+        'ExpressionAttributeNames': {f"#{key}": key for key in key_names}
+    }
+    
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            try:
+                table.update_item(
+                    Key={key: item[key] for key in key_names},
+                    UpdateExpression=f"SET #{attribute} = :value",
+                    # Don't recreate items deleted since the scan
+                    ConditionExpression=f"attribute_exists(#{key_names[0]})",
+                    ExpressionAttributeNames={f"#{attribute}": attribute, f"#{key_names[0]}": key_names[0]},
+                    ExpressionAttributeValues={':value': value}
+                )
+                updated += 1
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                pass
+        
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    return updated
+
+def main():
+    dynamodb = boto3.resource('dynamodb')
+    items_table = dynamodb.Table(os.getenv('PLAID_ITEMS_TABLE', 'plaid-items'))
+    reminders_table = dynamodb.Table(os.getenv('SUBSCRIPTION_REMINDERS_TABLE', 'subscription-reminders'))
+    
+    count = backfill(items_table, ('user_id', 'item_id'), 'gsi_pk', PLAID_ITEM_GSI_PK)
+    print(f"Set gsi_pk on {count} Plaid items")
+    
+    count = backfill(reminders_table, ('user_id', 'stream_id'), 'reminders_exist', 1)
+    print(f"Set reminders_exist on {count} reminders")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 import json
 import os
+import time
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from services.dynamodb_service import DynamoDBService
 
-# Lazy-load service
+# Lazy-load services
 _dynamodb_service = None
+_ses_client = None
+_cognito_client = None
+
+# Emails looked up from Cognito, keyed by user_id. Warm Lambda containers keep
+# module state, so later invocations reuse entries until they expire.
+EMAIL_CACHE_TTL = 3600
+_email_cache: Dict[str, Tuple[float, str]] = {}
 
 def get_dynamodb_service() -> DynamoDBService:
     """Lazily create and cache the DynamoDBService instance."""
@@ -16,121 +25,72 @@ def get_dynamodb_service() -> DynamoDBService:
         _dynamodb_service = DynamoDBService()
     return _dynamodb_service
 
-def convert_decimals(obj):
-    """Convert Decimal objects to floats for processing."""
-    if isinstance(obj, dict):
-        return {k: convert_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_decimals(i) for i in obj]
-    elif isinstance(obj, Decimal):
-        return float(obj)
-    else:
-        return obj
+# One row of the reminder email table; the rest of the email is the SES template
+REMINDER_ROW_HTML = """
+        <tr style="border-bottom: 1px solid #eee;">
+            <td style="padding: 12px 0;">{merchant}</td>
+            <td style="padding: 12px 0; text-align: right;">{currency} {amount:.2f}</td>
+        </tr>
+        """
+
+# SQS accepts at most 10 entries per SendMessageBatch call
+SQS_BATCH_SIZE = 10
+
+# Cognito returns at most 60 users per ListUsers call
+COGNITO_PAGE_SIZE = 60
+
+# Worker threads for per-user DynamoDB/Cognito lookups. SES is called once per
+# SQS batch, so this does not interact with the SES sending rate.
+MAX_WORKERS = 20
 
 def send_reminders(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
-    Scheduled Lambda function to send email reminders for upcoming subscriptions.
-    This function runs daily to check for subscriptions due within the reminder period.
+    Scheduled Lambda function to queue email reminders for upcoming subscriptions.
+    This function runs daily and only enumerates users: it queues one message per
+    user, and send_reminder_worker drains the queue at the SES sending rate.
     """
     try:
         print("Starting subscription reminder check...")
         
         dynamodb_service = get_dynamodb_service()
-        ses = boto3.client('ses', region_name='us-east-1')
-        from_email = os.environ.get('FROM_EMAIL', 'notifications@yourdomain.com')
+        sqs = boto3.client('sqs')
+        queue_url = os.environ['REMINDER_QUEUE_URL']
         
         # Get all users with reminders
-        all_users = dynamodb_service.get_all_users_with_reminders()
+        # (materialized, since the bulk email lookup picks its strategy by user count)
+        all_users = list(dynamodb_service.iter_all_users_with_reminders())
         print(f"Found {len(all_users)} users with reminders")
         
-        total_emails_sent = 0
+        # Resolve all emails up front instead of one Cognito call per user
+        emails = bulk_lookup_emails(all_users)
+        
+        total_users_queued = 0
         errors = []
+        jobs = []
         
         for user_id in all_users:
-            try:
-                print(f"Processing reminders for user: {user_id}")
-                
-                # Get user's reminders
-                reminders = dynamodb_service.get_reminders(user_id)
-                reminders = convert_decimals(reminders)
-                
-                # Get user's email from Cognito (you'll need to implement this)
-                user_email = get_user_email(user_id)
-                if not user_email:
-                    print(f"No email found for user {user_id}")
-                    continue
-                
-                # Check which reminders should be sent today
-                today = datetime.utcnow().date()
-                reminders_to_send = []
-                
-                for reminder in reminders:
-                    try:
-                        # Calculate when this subscription is due
-                        # For now, we'll use a simple approach based on frequency
-                        # In a real implementation, you'd want to track actual due dates
-                        frequency = reminder.get('frequency', 'monthly')
-                        last_amount = reminder.get('last_amount', {})
-                        
-                        # Simple logic: if it's been about a month since last payment, send reminder
-                        # This is a simplified approach - you'd want more sophisticated logic
-                        reminder_days = reminder.get('reminder_days_before', 3)
-                        
-                        # For demo purposes, let's send reminders for all subscriptions
-                        # In production, you'd check actual due dates
-                        reminders_to_send.append({
-                            'merchant_name': reminder.get('merchant_name', 'Unknown'),
-                            'amount': last_amount.get('amount', 0),
-                            'currency': last_amount.get('currency', 'USD'),
-                            'reminder_days': reminder_days
-                        })
-                        
-                    except Exception as e:
-                        error_msg = f"Error processing reminder {reminder.get('stream_id')} for user {user_id}: {str(e)}"
-                        print(error_msg)
-                        errors.append(error_msg)
-                
-                # Send email if there are reminders
-                if reminders_to_send:
-                    try:
-                        email_content = create_reminder_email(reminders_to_send)
-                        
-                        response = ses.send_email(
-                            Source=from_email,
-                            Destination={
-                                'ToAddresses': [user_email]
-                            },
-                            Message={
-                                'Subject': {
-                                    'Data': f'Subscription Reminders - {len(reminders_to_send)} upcoming payments',
-                                    'Charset': 'UTF-8'
-                                },
-                                'Body': {
-                                    'Html': {
-                                        'Data': email_content,
-                                        'Charset': 'UTF-8'
-                                    }
-                                }
-                            }
-                        )
-                        
-                        total_emails_sent += 1
-                        print(f"Sent reminder email to {user_email} for {len(reminders_to_send)} subscriptions")
-                        
-                    except Exception as e:
-                        error_msg = f"Error sending email to user {user_id}: {str(e)}"
-                        print(error_msg)
-                        errors.append(error_msg)
-                
-            except Exception as e:
-                error_msg = f"Error processing user {user_id}: {str(e)}"
-                print(error_msg)
-                errors.append(error_msg)
+            user_email = emails.get(user_id)
+            if not user_email:
+                print(f"No email found for user {user_id}")
+                continue
+            
+            jobs.append({'user_id': user_id, 'user_email': user_email})
+            if len(jobs) == SQS_BATCH_SIZE:
+                queued, queue_errors = enqueue_reminder_jobs(sqs, queue_url, jobs)
+                total_users_queued += queued
+                errors.extend(queue_errors)
+                jobs = []
+        
+        # Flush any remaining jobs
+        if jobs:
+            queued, queue_errors = enqueue_reminder_jobs(sqs, queue_url, jobs)
+            total_users_queued += queued
+            errors.extend(queue_errors)
         
         # Log summary
         summary = {
             'total_users_processed': len(all_users),
-            'total_emails_sent': total_emails_sent,
+            'total_users_queued': total_users_queued,
             'errors': errors,
             'timestamp': datetime.utcnow().isoformat()
         }
@@ -151,74 +111,265 @@ def send_reminders(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': error_msg})
         }
 
-def get_user_email(user_id: str) -> str:
+def send_reminder_worker(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
-    Get user's email from Cognito.
-    For now, we'll return a placeholder. In production, you'd query Cognito.
+    SQS-triggered Lambda function that sends reminder emails for queued users.
+    Each user's reminders are fetched concurrently, then the whole batch goes out
+    in a single SES bulk call. Records that fail are reported back so SQS retries
+    them (and eventually moves them to the DLQ).
     """
-    # TODO: Implement actual Cognito user lookup
-    # For now, return a placeholder email for testing
-    return f"user-{user_id}@example.com"
-
-def create_reminder_email(reminders: List[Dict[str, Any]]) -> str:
-    """Create HTML email content for subscription reminders."""
+    dynamodb_service = get_dynamodb_service()
+    ses = get_ses_client()
+    from_email = os.environ.get('FROM_EMAIL', 'notifications@yourdomain.com')
     
-    reminders_html = ""
-    for reminder in reminders:
-        amount = reminder.get('amount', 0)
-        currency = reminder.get('currency', 'USD')
-        merchant = reminder.get('merchant_name', 'Unknown')
+    message_ids = []
+    destinations = []
+    batch_item_failures = []
+    
+    # Fetch reminders concurrently; these calls are I/O-bound
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for record in event.get('Records', []):
+            try:
+                job = json.loads(record['body'])
+                future = executor.submit(process_user, dynamodb_service, job['user_id'], job['user_email'])
+                futures[future] = record['messageId']
+            except Exception as e:
+                print(f"Error reading reminder job {record.get('messageId')}: {str(e)}")
+                batch_item_failures.append({'itemIdentifier': record['messageId']})
         
-        reminders_html += f"""
-        <tr style="border-bottom: 1px solid #eee;">
-            <td style="padding: 12px 0;">{merchant}</td>
-            <td style="padding: 12px 0; text-align: right;">{currency} {amount:.2f}</td>
-        </tr>
-        """
+        for future in as_completed(futures):
+            destination, user_errors = future.result()
+            if destination:
+                destinations.append(destination)
+                message_ids.append(futures[future])
+            elif user_errors:
+                batch_item_failures.append({'itemIdentifier': futures[future]})
     
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Subscription Reminders</title>
-    </head>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-        <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px;">
-            <h1 style="color: #2c3e50; margin-bottom: 20px;">📅 Subscription Reminders</h1>
-            
-            <p style="margin-bottom: 20px;">
-                You have <strong>{len(reminders)} subscription(s)</strong> coming up for renewal soon.
-            </p>
-            
-            <div style="background-color: white; border-radius: 8px; padding: 20px; margin-bottom: 20px;">
-                <h2 style="color: #2c3e50; margin-bottom: 15px;">Upcoming Payments</h2>
-                
-                <table style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="border-bottom: 2px solid #3498db;">
-                            <th style="text-align: left; padding: 12px 0; color: #2c3e50;">Service</th>
-                            <th style="text-align: right; padding: 12px 0; color: #2c3e50;">Amount</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {reminders_html}
-                    </tbody>
-                </table>
-            </div>
+    if destinations:
+        send_errors = send_bulk_reminders(ses, from_email, destinations)
+        for message_id, error in zip(message_ids, send_errors):
+            if error:
+                batch_item_failures.append({'itemIdentifier': message_id})
+    
+    return {'batchItemFailures': batch_item_failures}
+
+def enqueue_reminder_jobs(sqs, queue_url: str, jobs: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+    """
+    Queue up to SQS_BATCH_SIZE reminder jobs (one per user) with a single SendMessageBatch call.
+    Returns the number of jobs queued and a list of per-job errors.
+    """
+    entries = [
+        {'Id': str(index), 'MessageBody': json.dumps(job)}
+        for index, job in enumerate(jobs)
+    ]
+    try:
+        response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    except Exception as e:
+        error_msg = f"Error queueing reminders for {len(jobs)} users: {str(e)}"
+        print(error_msg)
+        return 0, [error_msg]
+    
+    errors = []
+    for failure in response.get('Failed', []):
+        user_id = jobs[int(failure['Id'])]['user_id']
+        error_msg = f"Error queueing reminder for user {user_id}: {failure.get('Code')} {failure.get('Message', '')}".strip()
+        print(error_msg)
+        errors.append(error_msg)
+    
+    return len(response.get('Successful', [])), errors
+
+def process_user(dynamodb_service: DynamoDBService, user_id: str, user_email: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Build the SES bulk-send destination for a single user.
+    Returns the destination (or None if there is nothing to send) and any errors.
+    Runs on the send_reminder_worker threads, so it must not mutate shared state.
+    """
+    errors = []
+    try:
+        print(f"Processing reminders for user: {user_id}")
+        
+        # Get user's reminders
+        reminders = dynamodb_service.get_reminders_for_notification(user_id)
+        
+        # Check which reminders should be sent today
+        today = datetime.utcnow().date()
+        reminders_to_send = []
+        
+        for reminder in reminders:
+            # Calculate when this subscription is due
+            # For now, we'll use a simple approach based on frequency
+            # In a real implementation, you'd want to track actual due dates
+            frequency = reminder.get('frequency', 'monthly')
+            # last_amount may be stored as null, so guard before reading it
+            last_amount = reminder.get('last_amount') or {}
             
-            <div style="background-color: #e8f4fd; border-left: 4px solid #3498db; padding: 15px; margin-bottom: 20px;">
-                <p style="margin: 0; color: #2c3e50;">
-                    <strong>💡 Tip:</strong> Review these subscriptions and consider cancelling any you no longer use to save money!
-                </p>
-            </div>
+            # Simple logic: if it's been about a month since last payment, send reminder
+            # This is a simplified approach - you'd want more sophisticated logic
+            reminder_days = reminder.get('reminder_days_before', 3)
             
-            <p style="color: #7f8c8d; font-size: 14px; margin-top: 30px;">
-                This is an automated reminder from your Bract subscription management platform.
-            </p>
-        </div>
-    </body>
-    </html>
+            # For demo purposes, let's send reminders for all subscriptions
+            # In production, you'd check actual due dates
+            reminders_to_send.append({
+                'merchant_name': reminder.get('merchant_name', 'Unknown'),
+                'amount': last_amount.get('amount', 0),
+                'currency': last_amount.get('currency', 'USD'),
+                'reminder_days': reminder_days
+            })
+        
+        if not reminders_to_send:
+            return None, errors
+        
+        destination = {
+            'Destination': {
+                'ToAddresses': [user_email]
+            },
+            'ReplacementTemplateData': json.dumps({
+                'count': len(reminders_to_send),
+                'rows': create_reminder_rows(reminders_to_send)
+            })
+        }
+        return destination, errors
+        
+    except Exception as e:
+        error_msg = f"Error processing user {user_id}: {str(e)}"
+        print(error_msg)
+        errors.append(error_msg)
+        return None, errors
+
+def get_ses_client():
+    """Lazily create and cache the SES client so warm invocations reuse its connections."""
+    global _ses_client
+    if _ses_client is None:
+        _ses_client = boto3.client(
+            'ses',
+            region_name='us-east-1',
+            config=Config(retries={'max_attempts': 5, 'mode': 'adaptive'})
+        )
+    return _ses_client
+
+def get_cognito_client():
+    """Lazily create and cache the Cognito client."""
+    global _cognito_client
+    if _cognito_client is None:
+        _cognito_client = boto3.client('cognito-idp')
+    return _cognito_client
+
+def get_user_email(user_id: str) -> Optional[str]:
+    """
+    Get user's email from Cognito, cached for EMAIL_CACHE_TTL seconds.
+    user_id is the Cognito sub; AdminGetUser can't resolve a sub for federated
+    (Google) users, so we filter ListUsers on sub instead.
+    """
+    cached = _email_cache.get(user_id)
+    if cached and time.time() - cached[0] < EMAIL_CACHE_TTL:
+        return cached[1]
+    
+    response = get_cognito_client().list_users(
+        UserPoolId=os.environ['USER_POOL_ID'],
+        AttributesToGet=['email'],
+        Filter=f'sub = "{user_id}"',
+        Limit=1
+    )
+    users = response.get('Users', [])
+    if not users:
+        return None
+    
+    user_email = next((attr['Value'] for attr in users[0].get('Attributes', []) if attr['Name'] == 'email'), None)
+    if user_email:
+        _email_cache[user_id] = (time.time(), user_email)
+    return user_email
+
+def bulk_lookup_emails(user_ids: List[str]) -> Dict[str, str]:
+    """
+    Get emails for many users, keyed by user_id.
+    Sets that fit in one ListUsers page use the cached per-user lookup concurrently;
+    larger sets page through the user pool, COGNITO_PAGE_SIZE users per call.
+    """
+    if not user_ids:
+        return {}
+    
+    if len(user_ids) <= COGNITO_PAGE_SIZE:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            found = executor.map(lookup_email_safely, user_ids)
+            return {user_id: user_email for user_id, user_email in zip(user_ids, found) if user_email}
+    
+    wanted = set(user_ids)
+    emails = {}
+    now = time.time()
+    params = {
+        'UserPoolId': os.environ['USER_POOL_ID'],
+        'AttributesToGet': ['email', 'sub'],
+        'Limit': COGNITO_PAGE_SIZE
+    }
+    
+    while True:
+        response = get_cognito_client().list_users(**params)
+        for user in response.get('Users', []):
+            attributes = {attr['Name']: attr['Value'] for attr in user.get('Attributes', [])}
+            user_id = attributes.get('sub')
+            user_email = attributes.get('email')
+            if user_id in wanted and user_email:
+                emails[user_id] = user_email
+                _email_cache[user_id] = (now, user_email)
+        
+        # Handle pagination if needed
+        if 'PaginationToken' not in response:
+            break
+        params['PaginationToken'] = response['PaginationToken']
+    
+    return emails
+
+def lookup_email_safely(user_id: str) -> Optional[str]:
+    """get_user_email for use in a thread pool; errors are logged and treated as no email."""
+    try:
+        return get_user_email(user_id)
+    except Exception as e:
+        print(f"Error getting email for user {user_id}: {str(e)}")
+        return None
+
+def send_bulk_reminders(ses, from_email: str, destinations: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """
+    Send one SES bulk templated call for up to 50 recipients.
+    Returns one entry per destination: None if SES accepted it, otherwise the error.
     """
+    try:
+        response = ses.send_bulk_templated_email(
+            Source=from_email,
+            Template=os.environ.get('REMINDER_TEMPLATE', 'BractReminder'),
+            DefaultTemplateData=json.dumps({'count': 0, 'rows': ''}),
+            Destinations=destinations
+        )
+    except Exception as e:
+        error_msg = f"Error sending bulk reminder emails to {len(destinations)} users: {str(e)}"
+        print(error_msg)
+        return [error_msg] * len(destinations)
     
-    return html_content 
\ No newline at end of file
+    errors = []
+    # SES returns one status per destination, in request order
+    for destination, status in zip(destinations, response.get('Status', [])):
+        if status.get('Status') == 'Success':
+            errors.append(None)
+            continue
+        
+        user_email = destination['Destination']['ToAddresses'][0]
+        error_msg = f"Error sending email to {user_email}: {status.get('Status')} {status.get('Error', '')}".strip()
+        print(error_msg)
+        errors.append(error_msg)
+    
+    print(f"Sent {errors.count(None)} of {len(destinations)} reminder emails in bulk")
+    return errors
+
+def create_reminder_rows(reminders: List[Dict[str, Any]]) -> str:
+    """
+    Create the HTML table rows for the BractReminder SES template.
+    The surrounding email layout lives in the template itself (see template.yaml).
+    """
+    return ''.join(
+        REMINDER_ROW_HTML.format(
+            merchant=reminder.get('merchant_name', 'Unknown'),
+            currency=reminder.get('currency', 'USD'),
+            amount=reminder.get('amount', 0)
+        )
+        for reminder in reminders
+    )
@@ -1,53 +1,71 @@
 import json
+import logging
+import os
 import datetime
-from typing import Any, Dict
-from services.plaid_service import PlaidService
-from services.dynamodb_service import DynamoDBService
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional
 from models.plaid_model import PlaidItem, PlaidAccount
+from utils.json_encoder import BractEncoder
 
-# Lazy-load services so that simple OPTIONS calls don't fail during cold-start
+if TYPE_CHECKING:
+    from services.plaid_service import PlaidService
+    from services.dynamodb_service import DynamoDBService
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
+
+# Lazy-load services (and the boto3/Plaid SDK imports behind them) so that
+# simple OPTIONS calls don't fail or pay for them during cold-start
 _plaid_service = None  # type: PlaidService | None
 _dynamodb_service = None  # type: DynamoDBService | None
 
-def get_plaid_service() -> PlaidService:
+# Shared across warm invocations for overlapping independent I/O calls
+_executor = ThreadPoolExecutor(max_workers=4)
+
+def get_plaid_service() -> 'PlaidService':
     """Lazily create and cache the PlaidService instance."""
     global _plaid_service
     if _plaid_service is None:
+        from services.plaid_service import PlaidService
         _plaid_service = PlaidService()
     return _plaid_service
 
-def get_dynamodb_service() -> DynamoDBService:
+def get_dynamodb_service() -> 'DynamoDBService':
     """Lazily create and cache the DynamoDBService instance."""
     global _dynamodb_service
     if _dynamodb_service is None:
+        from services.dynamodb_service import DynamoDBService
         _dynamodb_service = DynamoDBService()
     return _dynamodb_service
 
-def get_cors_headers() -> Dict[str, Any]:
-    """Returns CORS headers for API responses."""
-    return {
-        'Access-Control-Allow-Origin': 'http://localhost:5173',
-        'Access-Control-Allow-Credentials': 'true',
-        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token',
-    }
+# CORS headers for API responses; shared by every response, so treat as read-only
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': 'http://localhost:5173',
+    'Access-Control-Allow-Credentials': 'true',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token',
+}
+
+def _extract_sub(event: Dict[str, Any]) -> Optional[str]:
+    """Returns the Cognito sub (our user_id) from the API Gateway authorizer claims."""
+    return event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('sub')
 
 def create_link_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Lambda handler for creating a Plaid link token."""
-    try:
-        # Handle preflight request
-        if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': get_cors_headers()
-            }
+    # Handle preflight request
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': _CORS_HEADERS
+        }
 
+    try:
         # Get user_id from the event (this will come from Cognito in production)
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('sub')
+        user_id = _extract_sub(event)
         if not user_id:
             return {
                 'statusCode': 400,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'User ID is required'})
             }
 
@@ -56,32 +74,32 @@ def create_link_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps(response)
         }
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
 
 def exchange_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Lambda handler for exchanging a public token for an access token."""
-    try:
-        # Handle preflight request
-        if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': get_cors_headers()
-            }
+    # Handle preflight request
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': _CORS_HEADERS
+        }
 
+    try:
         # Get user_id from the event
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('sub')
+        user_id = _extract_sub(event)
         if not user_id:
             return {
                 'statusCode': 400,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'User ID is required'})
             }
 
@@ -94,31 +112,36 @@ def exchange_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not all([public_token, institution_id, institution_name]):
             return {
                 'statusCode': 400,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'Missing required fields'})
             }
 
         # Exchange token
-        response = get_plaid_service().exchange_public_token(public_token)
+        plaid_service = get_plaid_service()
+        response = plaid_service.exchange_public_token(public_token)
         
-        # Create and store PlaidItem
+        # One timestamp for every record written by this link
+        now = datetime.datetime.utcnow()
+        
+        # Create PlaidItem
         plaid_item = PlaidItem(
             user_id=user_id,
             item_id=response['item_id'],
             access_token=response['access_token'],
             institution_id=institution_id,
             institution_name=institution_name,
-            created_at=datetime.datetime.utcnow(),
-            updated_at=datetime.datetime.utcnow()
+            created_at=now,
+            updated_at=now
         )
-        get_dynamodb_service().create_plaid_item(plaid_item)
+        # Store the PlaidItem while fetching accounts from Plaid; the two are independent
+        item_future = _executor.submit(get_dynamodb_service().create_plaid_item, plaid_item)
+        logger.debug("Getting accounts from Plaid for item %s", response['item_id'])
+        accounts_future = _executor.submit(plaid_service.get_accounts, response['access_token'])
 
-        # Get accounts from Plaid and store them
-        print("Getting accounts from Plaid")
-        accounts = get_plaid_service().get_accounts(response['access_token'])
+        # Store the accounts
+        accounts = accounts_future.result()
+        account_objs = []
         for account_data in accounts:
-            print("Account")
-            print(account_data)
             account = PlaidAccount(
                 account_id=account_data['account_id'],
                 user_id=user_id,
@@ -128,16 +151,20 @@ def exchange_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 type=account_data['type'],
                 subtype=account_data.get('subtype'),
                 mask=account_data.get('mask'),
-                created_at=datetime.datetime.utcnow(),
-                updated_at=datetime.datetime.utcnow()
+                created_at=now,
+                updated_at=now
             )
-            print(account)
-            get_dynamodb_service().create_account(account)
-            print("Stored account")
+            logger.debug("Storing account %s", account)
+            account_objs.append(account)
+        get_dynamodb_service().batch_create_accounts(account_objs)
+        logger.info("Linked %d accounts for user %s", len(account_objs), user_id)
+
+        # Surface any error from storing the PlaidItem
+        item_future.result()
 
         return {
             'statusCode': 200,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({
                 'message': 'Successfully linked account',
                 'item_id': response['item_id']
@@ -146,26 +173,26 @@ def exchange_token(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
 
 def get_accounts(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Lambda handler for retrieving a user's linked accounts."""
-    try:
-        # Handle preflight request
-        if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': get_cors_headers()
-            }
+    # Handle preflight request
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': _CORS_HEADERS
+        }
 
+    try:
         # Get user_id from the event
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('sub')
+        user_id = _extract_sub(event)
         if not user_id:
             return {
                 'statusCode': 400,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'User ID is required'})
             }
 
@@ -184,7 +211,7 @@ def get_accounts(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({
                 'accounts': accounts_data
             })
@@ -192,63 +219,54 @@ def get_accounts(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         }
 
-def convert_dates(obj):
-    if isinstance(obj, dict):
-        return {k: convert_dates(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_dates(i) for i in obj]
-    elif isinstance(obj, (datetime.date, datetime.datetime)):
-        return obj.isoformat()
-    else:
-        return obj
-
 def get_subscriptions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Lambda handler for fetching recurring subscriptions for the user."""
-    try:
-        # Handle preflight request
-        if event.get('httpMethod') == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': get_cors_headers()
-            }
+    # Handle preflight request
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': _CORS_HEADERS
+        }
 
+    try:
         # Get user_id from the event
-        user_id = event.get('requestContext', {}).get('authorizer', {}).get('claims', {}).get('sub')
+        user_id = _extract_sub(event)
         if not user_id:
             return {
                 'statusCode': 400,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'User ID is required'})
             }
 
-        # Get the user's Plaid items (bank connections)
-        plaid_items = get_dynamodb_service().get_plaid_items(user_id)
-        if not plaid_items:
+        # Get the access token of each of the user's Plaid items (bank connections)
+        access_tokens = get_dynamodb_service().get_access_tokens(user_id)
+        if not access_tokens:
             return {
                 'statusCode': 404,
-                'headers': get_cors_headers(),
+                'headers': _CORS_HEADERS,
                 'body': json.dumps({'error': 'No Plaid items found for user'})
             }
 
-        # For now, just use the first Plaid item (could be extended to all)
-        access_token = plaid_items[0].access_token
-
-        # Fetch recurring transactions (subscriptions) from Plaid
-        subscriptions = get_plaid_service().get_recurring_transactions(access_token)
-        subscriptions = convert_dates(subscriptions)
+        # Fetch recurring transactions (subscriptions) from Plaid for every item in parallel;
+        # repeat requests within RECURRING_CACHE_TTL are served from the service's cache
+        results = _executor.map(get_plaid_service().get_recurring_transactions, access_tokens)
+        subscriptions = {'outflow_streams': [], 'inflow_streams': []}
+        for result in results:
+            subscriptions['outflow_streams'].extend(result['outflow_streams'])
+            subscriptions['inflow_streams'].extend(result['inflow_streams'])
 
         return {
             'statusCode': 200,
-            'headers': get_cors_headers(),
-            'body': json.dumps(subscriptions)
+            'headers': _CORS_HEADERS,
+            'body': json.dumps(subscriptions, cls=BractEncoder)
         }
     except Exception as e:
         return {
             'statusCode': 500,
-            'headers': get_cors_headers(),
+            'headers': _CORS_HEADERS,
             'body': json.dumps({'error': str(e)})
         } 
\ No newline at end of file
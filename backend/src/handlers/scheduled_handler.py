@@ -1,149 +1,111 @@
 import json
+import logging
 import os
 import boto3
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 from services.plaid_service import PlaidService
 from services.dynamodb_service import DynamoDBService
+from utils.timestamps import now_iso
 
-# Lazy-load services
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
+
+# Services are cached per container; see the eager init below
 _plaid_service = None
 _dynamodb_service = None
 
 def get_plaid_service() -> PlaidService:
-    """Lazily create and cache the PlaidService instance."""
+    """Return the cached PlaidService, creating it if init-time creation failed."""
     global _plaid_service
     if _plaid_service is None:
         _plaid_service = PlaidService()
     return _plaid_service
 
 def get_dynamodb_service() -> DynamoDBService:
-    """Lazily create and cache the DynamoDBService instance."""
+    """Return the cached DynamoDBService, creating it if init-time creation failed."""
     global _dynamodb_service
     if _dynamodb_service is None:
         _dynamodb_service = DynamoDBService()
     return _dynamodb_service
 
+# Create the services during Lambda init rather than on the first invocation.
+# If that fails (e.g. env vars missing in local testing), log it and let the
+# getters above retry lazily.
+try:
+    get_plaid_service()
+    get_dynamodb_service()
+except Exception as e:
+    logger.warning("Deferring service creation to first use: %s", e)
+
+# Worker threads for per-user Plaid/DynamoDB calls
+MAX_WORKERS = 16
+
+# Reminder settings applied only when a subscription is first seen
+DEFAULT_REMINDER_SETTINGS = {
+    'reminder_days_before': 3,  # Default to 3 days
+    'delivery_method': 'email'
+}
+
 def convert_for_dynamodb(obj):
     """Convert objects to DynamoDB-compatible types."""
     if isinstance(obj, dict):
         return {k: convert_for_dynamodb(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [convert_for_dynamodb(i) for i in obj]
-    elif isinstance(obj, (datetime.date, datetime.datetime)):
+    elif isinstance(obj, (date, datetime)):
         return obj.isoformat()
     elif isinstance(obj, float):
         return Decimal(str(obj))  # Convert float to Decimal
     else:
         return obj
 
+def _last_amount_to_ddb(last_amount: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stream's flat last_amount dict for DynamoDB; only the amount is a float."""
+    return {k: (Decimal(str(v)) if isinstance(v, float) else v) for k, v in last_amount.items()}
+
 def sync_subscriptions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Scheduled Lambda function to sync subscriptions for all users.
     This function runs daily to keep the reminders table up-to-date.
     """
     try:
-        print("Starting subscription sync for all users...")
+        logger.info("Starting subscription sync for all users...")
         
         plaid_service = get_plaid_service()
         dynamodb_service = get_dynamodb_service()
         
-        # Get all users with Plaid items
-        all_users = dynamodb_service.get_all_users_with_plaid_items()
-        print(f"Found {len(all_users)} users with Plaid items")
-        
         total_subscriptions_synced = 0
         total_new_subscriptions = 0
         errors = []
         
-        for user_id in all_users:
-            try:
-                print(f"Processing user: {user_id}")
-                
-                # Get user's Plaid items
-                plaid_items = dynamodb_service.get_plaid_items(user_id)
-                if not plaid_items:
-                    print(f"No Plaid items found for user {user_id}")
-                    continue
-                
-                # Process each Plaid item (bank connection)
-                for plaid_item in plaid_items:
-                    try:
-                        print(f"Processing Plaid item {plaid_item.item_id} for user {user_id}")
-                        
-                        # Get current subscriptions from Plaid
-                        current_subscriptions = plaid_service.get_recurring_transactions(plaid_item.access_token)
-                        
-                        # Get existing reminders for this user
-                        existing_reminders = dynamodb_service.get_reminders(user_id)
-                        existing_stream_ids = {reminder['stream_id'] for reminder in existing_reminders}
-                        
-                        # Process each subscription stream
-                        for stream in current_subscriptions.get('outflow_streams', []):
-                            stream_id = stream['stream_id']
-                            total_subscriptions_synced += 1
-                            
-                            # Check if this is a new subscription
-                            if stream_id not in existing_stream_ids:
-                                total_new_subscriptions += 1
-                                print(f"New subscription found: {stream_id} for user {user_id}")
-                                
-                                # Create a default reminder for new subscriptions
-                                default_reminder = {
-                                    'user_id': user_id,
-                                    'stream_id': stream_id,
-                                    'reminder_days_before': 3,  # Default to 3 days
-                                    'delivery_method': 'email',
-                                    'created_at': datetime.utcnow().isoformat(),
-                                    'updated_at': datetime.utcnow().isoformat(),
-                                    'merchant_name': stream.get('merchant_name', 'Unknown'),
-                                    'last_amount': convert_for_dynamodb(stream.get('last_amount', {})),
-                                    'frequency': stream.get('frequency', 'monthly')
-                                }
-                                
-                                dynamodb_service.create_reminder(default_reminder)
-                                print(f"Created default reminder for stream {stream_id}")
-                            
-                            # Update existing reminder with latest subscription data
-                            else:
-                                # Update the reminder with latest subscription info
-                                update_data = {
-                                    'merchant_name': stream.get('merchant_name', 'Unknown'),
-                                    'last_amount': convert_for_dynamodb(stream.get('last_amount', {})),
-                                    'frequency': stream.get('frequency', 'monthly'),
-                                    'updated_at': datetime.utcnow().isoformat()
-                                }
-                                dynamodb_service.update_reminder(user_id, stream_id, update_data)
-                                print(f"Updated reminder for stream {stream_id}")
-                        
-                        # Handle inflow streams (income) if needed
-                        for stream in current_subscriptions.get('inflow_streams', []):
-                            # You can add logic here to handle income streams
-                            # For now, we'll just log them
-                            print(f"Income stream found: {stream['stream_id']} for user {user_id}")
-                            
-                    except Exception as e:
-                        error_msg = f"Error processing Plaid item {plaid_item.item_id} for user {user_id}: {str(e)}"
-                        print(error_msg)
-                        errors.append(error_msg)
-                
-            except Exception as e:
-                error_msg = f"Error processing user {user_id}: {str(e)}"
-                print(error_msg)
-                errors.append(error_msg)
+        # Users are independent and the work is I/O-bound, so process them concurrently.
+        # Users are submitted as index pages arrive, overlapping the query with the work.
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(process_user, plaid_service, dynamodb_service, user_id)
+                for user_id in dynamodb_service.iter_all_users_with_plaid_items()
+            ]
+            logger.info("Found %d users with Plaid items", len(futures))
+            
+            for future in as_completed(futures):
+                synced, new, user_errors = future.result()
+                total_subscriptions_synced += synced
+                total_new_subscriptions += new
+                errors.extend(user_errors)
         
         # Log summary
         summary = {
-            'total_users_processed': len(all_users),
+            'total_users_processed': len(futures),
             'total_subscriptions_synced': total_subscriptions_synced,
             'total_new_subscriptions': total_new_subscriptions,
             'errors': errors,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': now_iso()
         }
         
-        print("Subscription sync completed:")
-        print(json.dumps(summary, indent=2))
+        logger.info("Subscription sync completed: %s", json.dumps(summary, indent=2))
         
         return {
             'statusCode': 200,
@@ -152,8 +114,81 @@ def sync_subscriptions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
     except Exception as e:
         error_msg = f"Fatal error in subscription sync: {str(e)}"
-        print(error_msg)
+        logger.error(error_msg)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': error_msg})
-        } 
\ No newline at end of file
+        }
+
+def process_user(plaid_service: PlaidService, dynamodb_service: DynamoDBService, user_id: str) -> Tuple[int, int, List[str]]:
+    """
+    Sync every Plaid item for a single user.
+    Returns (subscriptions synced, new subscriptions, errors).
+    Runs on the sync_subscriptions worker threads, so it must not mutate shared state.
+    """
+    subscriptions_synced = 0
+    new_subscriptions = 0
+    errors = []
+    
+    try:
+        logger.debug("Processing user: %s", user_id)
+        
+        # Get user's Plaid items
+        plaid_items = dynamodb_service.get_plaid_items(user_id)
+        if not plaid_items:
+            logger.debug("No Plaid items found for user %s", user_id)
+            return subscriptions_synced, new_subscriptions, errors
+        
+        # Process each Plaid item (bank connection)
+        for plaid_item in plaid_items:
+            try:
+                logger.debug("Processing Plaid item %s for user %s", plaid_item.item_id, user_id)
+                
+                # Get current subscriptions from Plaid; each token is read once, so skip the cache
+                current_subscriptions = plaid_service.get_recurring_transactions(plaid_item.access_token, use_cache=False)
+                
+                # Nothing to write for items without subscriptions
+                outflow_streams = current_subscriptions.get('outflow_streams', [])
+                if not outflow_streams:
+                    logger.debug("No subscriptions for Plaid item %s", plaid_item.item_id)
+                    continue
+                
+                # Upsert a reminder per subscription stream; defaults only apply to new ones
+                updated_at = now_iso()
+                for stream in outflow_streams:
+                    stream_id = stream['stream_id']
+                    subscriptions_synced += 1
+                    
+                    stream_data = {
+                        'merchant_name': stream.get('merchant_name', 'Unknown'),
+                        'last_amount': _last_amount_to_ddb(stream.get('last_amount', {})),
+                        'frequency': stream.get('frequency', 'monthly'),
+                        'updated_at': updated_at
+                    }
+                    created = dynamodb_service.upsert_reminder(
+                        user_id, stream_id, stream_data, defaults=DEFAULT_REMINDER_SETTINGS
+                    )
+                    
+                    if created:
+                        new_subscriptions += 1
+                        logger.debug("New subscription found: %s for user %s", stream_id, user_id)
+                    else:
+                        logger.debug("Updated reminder for stream %s", stream_id)
+                
+                # Handle inflow streams (income) if needed
+                for stream in current_subscriptions.get('inflow_streams', []):
+                    # You can add logic here to handle income streams
+                    # For now, we'll just log them
+                    logger.debug("Income stream found: %s for user %s", stream['stream_id'], user_id)
+            
+            except Exception as e:
+                error_msg = f"Error processing Plaid item {plaid_item.item_id} for user {user_id}: {str(e)}"
+                logger.error(error_msg)
+                errors.append(error_msg)
+    
+    except Exception as e:
+        error_msg = f"Error processing user {user_id}: {str(e)}"
+        logger.error(error_msg)
+        errors.append(error_msg)
+    
+    return subscriptions_synced, new_subscriptions, errors
@@ -40,4 +40,11 @@ class PlaidAccount:
     updated_at: datetime
     official_name: Optional[str] = None
     subtype: Optional[str] = None
-    mask: Optional[str] = None
\ No newline at end of file
+    mask: Optional[str] = None
+
+    def __post_init__(self):
+        # Stored as-is, so make sure type/subtype are strings rather than Plaid SDK enums
+        if not isinstance(self.type, str):
+            self.type = str(self.type)
+        if self.subtype is not None and not isinstance(self.subtype, str):
+            self.subtype = str(self.subtype)
\ No newline at end of file
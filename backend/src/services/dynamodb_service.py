@@ -1,16 +1,61 @@
 import os
+import time
 from datetime import datetime
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 import boto3
+from botocore.config import Config
 from boto3.dynamodb.conditions import Key
 from models.plaid_model import PlaidItem, PlaidAccount
 
+# DynamoDB accepts at most 25 items per BatchWriteItem call
+BATCH_WRITE_SIZE = 25
+
+# BatchWriteItem calls per chunk before unprocessed items are given up on
+BATCH_WRITE_MAX_ATTEMPTS = 8
+
+# GSI over every Plaid item: gsi_pk (always PLAID_ITEM_GSI_PK) HASH, user_id RANGE
+PLAID_ITEMS_INDEX = 'GsiByAllItems'
+PLAID_ITEM_GSI_PK = 'PLAID_ITEM'
+
+# GSI over every reminder: reminders_exist (always 1) HASH, user_id RANGE
+REMINDERS_INDEX = 'ByRemindersExist'
+
 class DynamoDBService:
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
+        # Keep sockets alive between warm invocations and leave room in the pool
+        # for the handlers' worker threads, which share this service
+        config = Config(
+            tcp_keepalive=True,
+            max_pool_connections=50,
+            retries={'max_attempts': 3, 'mode': 'adaptive'}
+        )
+        self.dynamodb = boto3.resource('dynamodb', config=config)
         self.items_table = self.dynamodb.Table(os.getenv('PLAID_ITEMS_TABLE'))
         self.accounts_table = self.dynamodb.Table(os.getenv('PLAID_ACCOUNTS_TABLE'))
         self.reminders_table = self.dynamodb.Table(os.getenv('SUBSCRIPTION_REMINDERS_TABLE'))
+        
+        # Per-user lookups read through DAX when a cluster endpoint is configured;
+        # writes and index queries always go straight to DynamoDB
+        self.read_dynamodb = self._create_read_resource(os.getenv('DAX_ENDPOINT'))
+        self.items_read_table = self.read_dynamodb.Table(self.items_table.name)
+        self.accounts_read_table = self.read_dynamodb.Table(self.accounts_table.name)
+        self.reminders_read_table = self.read_dynamodb.Table(self.reminders_table.name)
+
+    def _create_read_resource(self, dax_endpoint: str):
+        """
+        Return a DAX resource for dax_endpoint, or the DynamoDB resource if DAX isn't available.
+        DAX clients don't implement get_paginator, so reads through this resource must page
+        with ExclusiveStartKey/LastEvaluatedKey instead of a paginator.
+        """
+        if not dax_endpoint:
+            return self.dynamodb
+        try:
+            import amazondax
+        except ImportError:
+            print("DAX_ENDPOINT is set but amazondax is not installed; reading from DynamoDB")
+            return self.dynamodb
+        return amazondax.AmazonDaxClient.resource(endpoint_url=dax_endpoint)
 
     def create_plaid_item(self, item: PlaidItem) -> None:
         """Store a new Plaid item in DynamoDB."""
@@ -23,13 +68,14 @@ class DynamoDBService:
                 'institution_name': item.institution_name,
                 'created_at': item.created_at.isoformat(),
                 'updated_at': item.updated_at.isoformat(),
-                'status': item.status
+                'status': item.status,
+                'gsi_pk': PLAID_ITEM_GSI_PK
             }
         )
 
     def get_plaid_items(self, user_id: str) -> List[PlaidItem]:
         """Retrieve all Plaid items for a user."""
-        response = self.items_table.query(
+        response = self.items_read_table.query(
             KeyConditionExpression=Key('user_id').eq(user_id)
         )
         
@@ -47,25 +93,43 @@ class DynamoDBService:
             ))
         return items
 
+    def get_access_tokens(self, user_id: str) -> List[str]:
+        """Retrieve only the access token of each of a user's Plaid items."""
+        response = self.items_read_table.query(
+            KeyConditionExpression=Key('user_id').eq(user_id),
+            ProjectionExpression='access_token'
+        )
+        return [item['access_token'] for item in response.get('Items', [])]
+
+    def _account_item(self, account: PlaidAccount) -> Dict[str, Any]:
+        """Build the DynamoDB item for a Plaid account."""
+        return {
+            'user_id': account.user_id,
+            'account_id': account.account_id,
+            'item_id': account.item_id,
+            'name': account.name,
+            'official_name': account.official_name,
+            'type': account.type,
+            'subtype': account.subtype,
+            'mask': account.mask,
+            'created_at': account.created_at.isoformat(),
+            'updated_at': account.updated_at.isoformat()
+        }
+
     def create_account(self, account: PlaidAccount) -> None:
-        self.accounts_table.put_item(
-            Item={
-                'user_id': account.user_id,
-                'account_id': account.account_id,
-                'item_id': account.item_id,
-                'name': account.name,
-                'official_name': account.official_name,
-                'type': str(account.type) if account.type is not None else None,
-                'subtype': str(account.subtype) if account.subtype is not None else None,
-                'mask': account.mask,
-                'created_at': account.created_at.isoformat(),
-                'updated_at': account.updated_at.isoformat()
-            }
+        self.accounts_table.put_item(Item=self._account_item(account))
+
+    def batch_create_accounts(self, accounts: List[PlaidAccount]) -> None:
+        """Store multiple Plaid accounts, up to 25 per BatchWriteItem call."""
+        self.batch_put(
+            self.accounts_table,
+            (self._account_item(account) for account in accounts),
+            key_names=('user_id', 'account_id')
         )
 
     def get_accounts(self, user_id: str) -> List[PlaidAccount]:
         """Retrieve all accounts for a user."""
-        response = self.accounts_table.query(
+        response = self.accounts_read_table.query(
             KeyConditionExpression=Key('user_id').eq(user_id)
         )
         
@@ -109,109 +173,155 @@ class DynamoDBService:
             except Exception as e:
                 print("Error creating/storing PlaidAccount:", e)
 
-    def get_all_users_with_plaid_items(self) -> List[str]:
-        """Get all unique user IDs that have Plaid items."""
+    def iter_all_users_with_plaid_items(self) -> Iterator[str]:
+        """Yield each unique user ID that has Plaid items, as index pages arrive."""
         try:
-            # Scan the items table to get all users
-            response = self.items_table.scan(
-                ProjectionExpression='user_id',
-                Select='SPECIFIC_ATTRIBUTES'
+            # Query the all-items index instead of scanning the whole table
+            paginator = self.dynamodb.meta.client.get_paginator('query')
+            pages = paginator.paginate(
+                TableName=self.items_table.name,
+                IndexName=PLAID_ITEMS_INDEX,
+                KeyConditionExpression=Key('gsi_pk').eq(PLAID_ITEM_GSI_PK),
+                ProjectionExpression='user_id'
             )
             
-            # Extract unique user IDs
-            user_ids = set()
-            for item in response.get('Items', []):
-                user_ids.add(item['user_id'])
-            
-            # Handle pagination if needed
-            while 'LastEvaluatedKey' in response:
-                response = self.items_table.scan(
-                    ProjectionExpression='user_id',
-                    Select='SPECIFIC_ATTRIBUTES',
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                for item in response.get('Items', []):
-                    user_ids.add(item['user_id'])
-            
-            return list(user_ids)
+            # One index entry per Plaid item, sorted by user_id, so duplicates are adjacent
+            last_user_id = None
+            for page in pages:
+                for item in page.get('Items', []):
+                    if item['user_id'] != last_user_id:
+                        last_user_id = item['user_id']
+                        yield last_user_id
         except Exception as e:
             print(f"Error getting all users with Plaid items: {e}")
-            return []
 
-    def get_reminders(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all reminders for a user."""
+    def get_reminders(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield all reminders for a user, one query page at a time."""
         try:
-            response = self.reminders_table.query(
-                KeyConditionExpression=Key('user_id').eq(user_id)
-            )
-            return response.get('Items', [])
+            # Page by hand rather than with a paginator, which DAX doesn't support
+            query_kwargs = {'KeyConditionExpression': Key('user_id').eq(user_id)}
+            while True:
+                response = self.reminders_read_table.query(**query_kwargs)
+                yield from response.get('Items', [])
+                
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         except Exception as e:
             print(f"Error getting reminders for user {user_id}: {e}")
-            return []
 
-    def create_reminder(self, reminder_data: Dict[str, Any]) -> None:
-        """Create a new reminder."""
-        try:
-            self.reminders_table.put_item(Item=reminder_data)
-        except Exception as e:
-            print(f"Error creating reminder: {e}")
-            raise
+    def get_reminders_for_notification(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield a user's reminders with only the attributes needed to build reminder emails.
+        Query errors propagate so the reminder worker can report the job for an SQS retry.
+        """
+        fields = ('stream_id', 'merchant_name', 'last_amount', 'reminder_days_before', 'frequency')
+        paginator = self.dynamodb.meta.client.get_paginator('query')
+        pages = paginator.paginate(
+            TableName=self.reminders_table.name,
+            KeyConditionExpression=Key('user_id').eq(user_id),
+            ProjectionExpression=", ".join(f"#{field}" for field in fields),
+            ExpressionAttributeNames={f"#{field}": field for field in fields}
+        )
+        for page in pages:
+            yield from page.get('Items', [])
 
-    def update_reminder(self, user_id: str, stream_id: str, update_data: Dict[str, Any]) -> None:
-        """Update an existing reminder."""
-        try:
-            # Build update expression
-            update_expression = "SET "
-            expression_attribute_values = {}
+    def batch_put(self, table, items: Iterable[Dict[str, Any]], key_names: Tuple[str, ...]) -> None:
+        """
+        Put items into a table with BatchWriteItem, BATCH_WRITE_SIZE items per call.
+        Unprocessed items are resent with exponential backoff, up to BATCH_WRITE_MAX_ATTEMPTS
+        calls per chunk; after that a RuntimeError is raised. Its message only names the
+        unwritten items' key_names attributes (items may hold secrets such as access tokens);
+        the full items are available as the exception's unprocessed_items attribute.
+        """
+        client = self.dynamodb.meta.client
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, BATCH_WRITE_SIZE))
+            if not chunk:
+                break
             
-            for key, value in update_data.items():
-                update_expression += f"#{key} = :{key}, "
-                expression_attribute_values[f":{key}"] = value
+            request_items = {table.name: [{'PutRequest': {'Item': item}} for item in chunk]}
+            for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+                if attempt:
+                    time.sleep(min(0.05 * 2 ** attempt, 2))
+                response = client.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
+                if not request_items:
+                    break
             
-            # Remove trailing comma and space
-            update_expression = update_expression.rstrip(", ")
+            if request_items:
+                unwritten = [request['PutRequest']['Item'] for request in request_items.get(table.name, [])]
+                keys = [{key: item.get(key) for key in key_names} for item in unwritten]
+                error = RuntimeError(
+                    f"{len(unwritten)} items were not written to {table.name} after "
+                    f"{BATCH_WRITE_MAX_ATTEMPTS} attempts: {keys}"
+                )
+                error.unprocessed_items = unwritten
+                raise error
+
+    def upsert_reminder(self, user_id: str, stream_id: str, reminder_data: Dict[str, Any],
+                        defaults: Dict[str, Any] = None) -> bool:
+        """
+        Create or update a reminder in a single write.
+        reminder_data must include updated_at, which also seeds created_at on insert.
+        created_at and any defaults are only set when the reminder is first inserted.
+        Returns True if the reminder did not exist before this call.
+        """
+        defaults = defaults or {}
+        if 'updated_at' not in reminder_data:
+            raise ValueError("reminder_data must include updated_at")
+        overlap = set(defaults) & {*reminder_data, 'user_id', 'stream_id', 'created_at', 'reminders_exist'}
+        if overlap:
+            raise ValueError(f"defaults can't include attributes that are always written: {sorted(overlap)}")
+        
+        try:
+            update_data = {k: v for k, v in reminder_data.items() if k not in ('user_id', 'stream_id', 'created_at')}
+            update_data['reminders_exist'] = 1
+            
+            assignments = [f"#{key} = :{key}" for key in update_data]
+            assignments += [f"#{key} = if_not_exists(#{key}, :{key})" for key in defaults]
+            assignments.append("#created_at = if_not_exists(#created_at, :updated_at)")
+            update_expression = "SET " + ", ".join(assignments)
             
-            # Build expression attribute names
-            expression_attribute_names = {f"#{key}": key for key in update_data.keys()}
+            expression_attribute_names = {f"#{key}": key for key in (*update_data, *defaults)}
+            expression_attribute_names['#created_at'] = 'created_at'
+            expression_attribute_values = {f":{key}": value for key, value in {**update_data, **defaults}.items()}
             
-            self.reminders_table.update_item(
+            response = self.reminders_table.update_item(
                 Key={
                     'user_id': user_id,
                     'stream_id': stream_id
                 },
                 UpdateExpression=update_expression,
                 ExpressionAttributeNames=expression_attribute_names,
-                ExpressionAttributeValues=expression_attribute_values
+                ExpressionAttributeValues=expression_attribute_values,
+                ReturnValues='UPDATED_OLD'
             )
+            # A brand-new item has no previous values to return
+            return not response.get('Attributes')
         except Exception as e:
-            print(f"Error updating reminder for user {user_id}, stream {stream_id}: {e}")
+            print(f"Error upserting reminder for user {user_id}, stream {stream_id}: {e}")
             raise
 
-    def get_all_users_with_reminders(self) -> List[str]:
-        """Get all unique user IDs that have reminders."""
+    def iter_all_users_with_reminders(self) -> Iterator[str]:
+        """Yield each unique user ID that has reminders, as index pages arrive."""
         try:
-            # Scan the reminders table to get all users
-            response = self.reminders_table.scan(
-                ProjectionExpression='user_id',
-                Select='SPECIFIC_ATTRIBUTES'
+            # Query the sparse reminders index instead of scanning the whole table
+            paginator = self.dynamodb.meta.client.get_paginator('query')
+            pages = paginator.paginate(
+                TableName=self.reminders_table.name,
+                IndexName=REMINDERS_INDEX,
+                KeyConditionExpression=Key('reminders_exist').eq(1),
+                ProjectionExpression='user_id'
             )
             
-            # Extract unique user IDs
-            user_ids = set()
-            for item in response.get('Items', []):
-                user_ids.add(item['user_id'])
-            
-            # Handle pagination if needed
-            while 'LastEvaluatedKey' in response:
-                response = self.reminders_table.scan(
-                    ProjectionExpression='user_id',
-                    Select='SPECIFIC_ATTRIBUTES',
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                for item in response.get('Items', []):
-                    user_ids.add(item['user_id'])
-            
-            return list(user_ids)
+            # One index entry per reminder, sorted by user_id, so duplicates are adjacent
+            last_user_id = None
+            for page in pages:
+                for item in page.get('Items', []):
+                    if item['user_id'] != last_user_id:
+                        last_user_id = item['user_id']
+                        yield last_user_id
         except Exception as e:
-            print(f"Error getting all users with reminders: {e}")
-            return [] 
\ No newline at end of file
+            print(f"Error getting all users with reminders: {e}")
\ No newline at end of file
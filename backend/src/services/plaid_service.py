@@ -1,12 +1,22 @@
 import os
+import time
+from typing import Dict, Tuple
 import plaid
 from plaid.api import plaid_api
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.model.products import Products
-from plaid.model.country_code import CountryCode
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.accounts_get_request import AccountsGetRequest
+
+# Plaid request models are imported inside the methods that use them
+
+# Recurring streams that aren't subscriptions: credit card payments and bank transfers
+EXCLUDED_CATEGORIES = frozenset({
+    'LOAN_PAYMENTS_CREDIT_CARD_PAYMENT',
+    'TRANSFER_OUT_ACCOUNT_TRANSFER',
+})
+
+# Lowercase description fragments for the same, plus savings transfers and ATM withdrawals
+EXCLUDED_KEYWORDS = ('credit card', 'chase card', 'transfer', 'sav', 'atm')
+
+# Seconds a recurring-transactions response is reused, e.g. across subscription page reloads
+RECURRING_CACHE_TTL = 300
 
 class PlaidService:
     def __init__(self):
@@ -29,12 +39,23 @@ class PlaidService:
                 'secret': self.secret,
             }
         )
+        # Room for concurrent Plaid calls from the handler/sync thread pools, reusing connections
+        configuration.connection_pool_maxsize = 50
+        configuration.retries = 3
         
         api_client = plaid.ApiClient(configuration)
         self.client = plaid_api.PlaidApi(api_client)
+        
+        # Recurring-transactions responses by (access_token, account_ids), with the time fetched
+        self._rt_cache: Dict[Tuple[str, tuple], Tuple[float, dict]] = {}
 
     def create_link_token(self, user_id: str) -> dict:
         """Create a link token for Plaid Link initialization."""
+        from plaid.model.link_token_create_request import LinkTokenCreateRequest
+        from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+        from plaid.model.products import Products
+        from plaid.model.country_code import CountryCode
+        
         request = LinkTokenCreateRequest(
             products=[Products("transactions")],  # Remove "auth" product - not authorized in production
             client_name="Bract",
@@ -55,6 +76,8 @@ class PlaidService:
 
     def exchange_public_token(self, public_token: str) -> dict:
         """Exchange a public token for an access token."""
+        from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
+        
         request = ItemPublicTokenExchangeRequest(
             public_token=public_token
         )
@@ -67,17 +90,20 @@ class PlaidService:
 
     def get_accounts(self, access_token: str) -> list:
         """Get all accounts for a given access token."""
+        from plaid.model.accounts_get_request import AccountsGetRequest
+        
         request = AccountsGetRequest(access_token=access_token)
         response = self.client.accounts_get(request)
         
+        # Convert the SDK's AccountType/AccountSubtype enums to plain strings once, here
         accounts = []
         for account in response.accounts:
             accounts.append({
                 'account_id': account.account_id,
                 'name': account.name,
                 'official_name': account.official_name,
-                'type': account.type,
-                'subtype': account.subtype,
+                'type': str(account.type),
+                'subtype': str(account.subtype) if account.subtype is not None else None,
                 'mask': account.mask
             })
         
@@ -88,8 +114,18 @@ class PlaidService:
         # This will be implemented later when we set up transaction processing
         pass 
 
-    def get_recurring_transactions(self, access_token: str, account_ids: list = None) -> dict:
-        """Fetch recurring transactions (subscriptions) using Plaid's /transactions/recurring/get endpoint."""
+    def get_recurring_transactions(self, access_token: str, account_ids: list = None, use_cache: bool = True) -> dict:
+        """
+        Fetch recurring transactions (subscriptions) using Plaid's /transactions/recurring/get endpoint.
+        Responses are reused for RECURRING_CACHE_TTL seconds unless use_cache is False; callers that
+        read each access token once (like the daily sync) should pass False to keep memory flat.
+        """
+        cache_key = (access_token, tuple(account_ids or ()))
+        if use_cache:
+            cached = self._rt_cache.get(cache_key)
+            if cached and time.time() - cached[0] < RECURRING_CACHE_TTL:
+                return cached[1]
+        
         request_data = {"access_token": access_token}
         if account_ids:
             request_data["account_ids"] = account_ids
@@ -100,35 +136,41 @@ class PlaidService:
         filtered_outflow_streams = self.filter_subscription_streams(response.outflow_streams)
         
         # Return both outflow_streams (subscriptions/bills) and inflow_streams (salary, etc)
-        return {
-            "outflow_streams": [stream.to_dict() for stream in filtered_outflow_streams],
+        recurring = {
+            "outflow_streams": filtered_outflow_streams,
             "inflow_streams": [stream.to_dict() for stream in response.inflow_streams],
-        } 
+        }
+        if use_cache:
+            self._store_recurring(cache_key, recurring)
+        return recurring
+
+    def _store_recurring(self, cache_key: Tuple[str, tuple], recurring: dict) -> None:
+        """Cache a recurring-transactions response, dropping expired entries so the cache stays small."""
+        now = time.time()
+        # list() snapshots the keys, since handler threads may insert concurrently
+        for key in list(self._rt_cache):
+            cached = self._rt_cache.get(key)
+            if cached and now - cached[0] >= RECURRING_CACHE_TTL:
+                self._rt_cache.pop(key, None)
+        self._rt_cache[cache_key] = (now, recurring)
 
     def filter_subscription_streams(self, streams: list) -> list:
-        """Filter out non-subscription recurring transactions like credit card payments and bank transfers."""
+        """
+        Filter out non-subscription recurring transactions like credit card payments and bank transfers.
+        Returns the kept streams as dicts, reusing the to_dict() conversion done for filtering.
+        """
         filtered_streams = []
         
         for stream in streams:
             stream_dict = stream.to_dict()
+            category = (stream_dict.get('personal_finance_category') or {}).get('detailed')
+            description = (stream_dict.get('description') or '').lower()
             
-            # Skip credit card payments
-            if (stream_dict.get('personal_finance_category', {}).get('detailed') == 'LOAN_PAYMENTS_CREDIT_CARD_PAYMENT' or
-                'credit card' in stream_dict.get('description', '').lower() or
-                'chase card' in stream_dict.get('description', '').lower()):
-                continue
-            
-            # Skip bank transfers
-            if (stream_dict.get('personal_finance_category', {}).get('detailed') == 'TRANSFER_OUT_ACCOUNT_TRANSFER' or
-                'transfer' in stream_dict.get('description', '').lower() or
-                'sav' in stream_dict.get('description', '').lower()):
-                continue
-            
-            # Skip ATM withdrawals
-            if 'atm' in stream_dict.get('description', '').lower():
+            # Skip credit card payments, bank transfers and ATM withdrawals
+            if category in EXCLUDED_CATEGORIES or any(keyword in description for keyword in EXCLUDED_KEYWORDS):
                 continue
             
             # Keep everything else (actual subscriptions)
-            filtered_streams.append(stream)
+            filtered_streams.append(stream_dict)
         
-        return filtered_streams 
\ No newline at end of file
+        return filtered_streams
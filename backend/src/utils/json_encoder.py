@@ -0,0 +1,13 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+class BractEncoder(json.JSONEncoder):
+    """JSON encoder for DynamoDB Decimals and Plaid dates, applied during serialization."""
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, date):  # also covers datetime
+            return o.isoformat()
+        return super().default(o)
@@ -0,0 +1,5 @@
+from datetime import datetime, timezone
+
+def now_iso() -> str:
+    """Current UTC time as a timezone-aware ISO 8601 string; use for every stored reminder timestamp."""
+    return datetime.now(timezone.utc).isoformat()